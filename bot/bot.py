@@ -8,104 +8,301 @@ IGNYTE Deploy Bot v2
 - Supports section-level edits without full regeneration
 """
 
-import os, subprocess, logging, json, hashlib, glob
+import os, subprocess, logging, json, hashlib, re, time, asyncio, threading, tempfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from telegram import Update
 from telegram.ext import Application, MessageHandler, CommandHandler, filters, ContextTypes
 import anthropic
+import httpx
+
+try:
+    import h2  # noqa: F401  (optional: enables HTTP/2 in httpx)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
 
 TELEGRAM_TOKEN = os.environ.get("TELEGRAM_TOKEN")
 CLAUDE_API_KEY = os.environ.get("CLAUDE_API_KEY")
 REPO_PATH = os.environ.get("REPO_PATH", "/home/ubuntu/ignyte")
 PROD_DIR = os.path.join(REPO_PATH, "public_html")
 DEV_DIR = os.path.join(REPO_PATH, "public_html", "dev")
-DEPLOY_LOG = os.path.join(REPO_PATH, ".deploy_log.json")
+DEPLOY_LOG = os.path.join(REPO_PATH, ".deploy_log.jsonl")  # one JSON entry per line
+LEGACY_DEPLOY_LOG = os.path.join(REPO_PATH, ".deploy_log.json")  # old single-array format
+DEPLOY_LOG_KEEP = 50
+DEPLOY_LOG_COMPACT_AT = 60  # rewrite down to DEPLOY_LOG_KEEP once this many lines pile up
 ALLOWED_USER_IDS = os.environ.get("ALLOWED_USERS", "").split(",")  # comma-separated Telegram user IDs
+CONFIRM_RE = re.compile(r"(?i)^(yes|y|no|n)$")
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-claude = anthropic.Anthropic(api_key=CLAUDE_API_KEY)
+# One long-lived async client so generations reuse pooled keep-alive connections
+claude = anthropic.AsyncAnthropic(
+    api_key=CLAUDE_API_KEY,
+    http_client=anthropic.DefaultAsyncHttpxClient(
+        http2=HTTP2_AVAILABLE,
+        limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+    ),
+)
 
 
 # ─── Helpers ──────────────────────────────────────────────────────────────────
 
+# (directory, extensions) -> (signature, files); signature is the sorted
+# (path, mtime_ns, size) of every matched file, so any edit invalidates it.
+_site_cache = OrderedDict()
+_site_cache_lock = threading.Lock()  # handlers read files from worker threads
+SITE_CACHE_SIZE = 4
+READ_WORKERS = 8
+MAX_READ = 200_000  # files over this many bytes (bundles, generated assets) are skipped
+
+
+def _scan_site_files(directory, extensions):
+    """Walk directory once, yielding (path, mtime_ns, size) for matching files.
+
+    Hidden files and directories are skipped, as glob's ``**`` pattern did,
+    as are minified bundles (``*.min.*``) and files over MAX_READ bytes.
+    """
+    exts = set(extensions)
+    stack = [directory]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    if entry.name.startswith("."):
+                        continue
+                    try:
+                        if entry.is_dir():
+                            stack.append(entry.path)
+                        elif os.path.splitext(entry.name)[1] in exts and ".min." not in entry.name:
+                            st = entry.stat()
+                            if st.st_size > MAX_READ:
+                                logger.debug(f"Skipping {entry.path}: {st.st_size:,} bytes")
+                                continue
+                            yield entry.path, st.st_mtime_ns, st.st_size
+                    except OSError as e:
+                        logger.warning(f"Could not stat {entry.path}: {e}")
+        except FileNotFoundError:
+            continue
+        except OSError as e:
+            logger.warning(f"Could not scan {current}: {e}")
+
+
+def _read_site_file(filepath):
+    """Read one site file, or return None (and log) if it can't be read."""
+    try:
+        with open(filepath, "r", encoding="utf-8") as f:
+            return f.read(MAX_READ)  # characters; guards against growth after the scan
+    except Exception as e:
+        logger.warning(f"Could not read {filepath}: {e}")
+        return None
+
+
 def read_site_files(directory=PROD_DIR, extensions=(".html", ".css", ".js")):
-    """Read all current site files and return as a context dict."""
+    """Read all current site files and return as a context dict.
+
+    Results are cached per directory and reused until a file is added,
+    removed, or its mtime/size changes.
+    """
+    signature = tuple(sorted(_scan_site_files(directory, extensions)))
+
+    key = (directory, tuple(extensions))
+    with _site_cache_lock:
+        cached = _site_cache.get(key)
+        if cached and cached[0] == signature:
+            _site_cache.move_to_end(key)
+            return dict(cached[1])
+
+    paths = [filepath for filepath, _, _ in signature]
+    if len(paths) > 1:
+        with ThreadPoolExecutor(max_workers=min(READ_WORKERS, len(paths))) as ex:
+            contents = list(ex.map(_read_site_file, paths))
+    else:
+        contents = [_read_site_file(filepath) for filepath in paths]
+
     files = {}
-    for ext in extensions:
-        for filepath in glob.glob(os.path.join(directory, f"**/*{ext}"), recursive=True):
-            rel_path = os.path.relpath(filepath, directory)
-            try:
-                with open(filepath, "r", encoding="utf-8") as f:
-                    content = f.read()
-                files[rel_path] = content
-            except Exception as e:
-                logger.warning(f"Could not read {filepath}: {e}")
-    return files
+    for filepath, content in zip(paths, contents):
+        if content is not None:
+            files[os.path.relpath(filepath, directory)] = content
+
+    if len(files) < len(paths):
+        # Don't cache a partial read: e.g. a chmod that fixes a permission
+        # error doesn't change mtime, so the file would stay hidden.
+        return dict(files)
+
+    with _site_cache_lock:
+        _site_cache[key] = (signature, files)
+        _site_cache.move_to_end(key)
+        if len(_site_cache) > SITE_CACHE_SIZE:
+            _site_cache.popitem(last=False)
+    return dict(files)
+
+
+async def snapshot_site_files():
+    """Read production and /dev files concurrently; returns (prod, dev)."""
+    return await asyncio.gather(
+        asyncio.to_thread(read_site_files, PROD_DIR),
+        asyncio.to_thread(read_site_files, DEV_DIR),
+    )
 
 
 def content_hash(content):
-    """Hash content to detect duplicates."""
-    return hashlib.md5(content.encode()).hexdigest()
+    """Hash content (str or already-encoded bytes) to detect duplicates."""
+    if isinstance(content, str):
+        content = content.encode()
+    return hashlib.blake2b(content, digest_size=16).hexdigest()
+
+
+# In-memory copy of the deploy log, valid while the file's mtime is unchanged.
+# "seen" mirrors data as a set of (file, hash) pairs for O(1) dedup checks.
+_log_cache = {"mtime": None, "data": None, "seen": set()}
+
+
+def _log_mtime():
+    try:
+        return os.stat(DEPLOY_LOG).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def _cache_deploy_log(mtime, log):
+    _log_cache["mtime"] = mtime
+    _log_cache["data"] = log
+    _log_cache["seen"] = {(entry["file"], entry["hash"]) for entry in log}
+
+
+def _parse_deploy_log(f):
+    log = []
+    for lineno, line in enumerate(f, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            log.append(json.loads(line))
+        except json.JSONDecodeError:
+            # e.g. a partial line from an interrupted append
+            logger.warning(f"Skipping malformed deploy log line {lineno}")
+    return log
+
+
+def _migrate_legacy_deploy_log():
+    """Convert the old JSON-array log to JSONL (once, at startup)."""
+    if os.path.exists(DEPLOY_LOG) or not os.path.exists(LEGACY_DEPLOY_LOG):
+        return
+    with open(LEGACY_DEPLOY_LOG, "r") as f:
+        log = json.load(f)
+    save_deploy_log(log[-DEPLOY_LOG_KEEP:])
+    os.remove(LEGACY_DEPLOY_LOG)
+    logger.info(f"Migrated {LEGACY_DEPLOY_LOG} to {DEPLOY_LOG}")
 
 
 def load_deploy_log():
-    """Load deployment history."""
-    if os.path.exists(DEPLOY_LOG):
+    """Load deployment history (cached until the log file changes on disk)."""
+    mtime = _log_mtime()
+    if _log_cache["data"] is not None and _log_cache["mtime"] == mtime:
+        return list(_log_cache["data"])
+    log = []
+    if mtime is not None:
         with open(DEPLOY_LOG, "r") as f:
-            return json.load(f)
-    return []
+            log = _parse_deploy_log(f)
+    _cache_deploy_log(mtime, log)
+    return list(log)
 
 
 def save_deploy_log(log):
-    """Save deployment history."""
-    with open(DEPLOY_LOG, "w") as f:
-        json.dump(log, f, indent=2)
+    """Rewrite deployment history atomically (used for compaction)."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(DEPLOY_LOG), prefix=".deploy_log.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.writelines(json.dumps(entry) + "\n" for entry in log)
+        os.chmod(tmp_path, 0o644)  # mkstemp creates 0600; keep the usual log mode
+        os.replace(tmp_path, DEPLOY_LOG)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    _cache_deploy_log(_log_mtime(), list(log))
 
 
 def log_deployment(filename, hash_val, prompt_summary):
-    """Record a deployment."""
+    """Record a deployment (appends one line; compacts every few deploys)."""
     log = load_deploy_log()
-    log.append({
+    entry = {
         "file": filename,
         "hash": hash_val,
         "prompt": prompt_summary[:100],
         "timestamp": datetime.now().isoformat()
-    })
-    # Keep last 50 entries
-    save_deploy_log(log[-50:])
+    }
+    log.append(entry)
+    if len(log) >= DEPLOY_LOG_COMPACT_AT:
+        # Keep last 50 entries
+        save_deploy_log(log[-DEPLOY_LOG_KEEP:])
+        return
+    with open(DEPLOY_LOG, "a") as f:
+        f.write(json.dumps(entry) + "\n")
+    _cache_deploy_log(_log_mtime(), log)
 
 
 def was_already_deployed(filename, hash_val):
     """Check if identical content was already deployed."""
-    log = load_deploy_log()
-    return any(entry["file"] == filename and entry["hash"] == hash_val for entry in log)
+    load_deploy_log()  # refresh the cache if the file changed on disk
+    return (filename, hash_val) in _log_cache["seen"]
+
+
+# add + commit + push in one shell so a deploy costs a single fork/exec;
+# prints NOOP and exits 0 when there is nothing staged. $1 is the message.
+_GIT_PUSH_SCRIPT = (
+    'git add . && '
+    'if git diff --cached --quiet; then echo NOOP; '
+    'else git commit -m "$1" && git push origin main; fi'
+)
 
 
 def git_push(repo_path, message):
     """Push changes to GitHub."""
     try:
-        os.chdir(repo_path)
-        subprocess.run(["git", "add", "."], check=True, capture_output=True)
         result = subprocess.run(
-            ["git", "status", "--porcelain"], capture_output=True, text=True
+            ["sh", "-c", _GIT_PUSH_SCRIPT, "git_push", message],
+            cwd=repo_path, check=True, capture_output=True, text=True
         )
-        if not result.stdout.strip():
+        if result.stdout.strip() == "NOOP":
             return "⚠️ No changes to push."
-        subprocess.run(["git", "commit", "-m", message], check=True, capture_output=True, text=True)
-        subprocess.run(["git", "push", "origin", "main"], check=True, capture_output=True)
         return "✅ Pushed to GitHub → Hostinger auto-deploy triggered"
     except subprocess.CalledProcessError as e:
-        return f"❌ Git error: {e.stderr if hasattr(e, 'stderr') else str(e)}"
+        return f"❌ Git error: {e.stderr or e.stdout}"
+
+
+# Updates are handled concurrently (see main), so anything touching git, the
+# deploy log, /dev staging, or user_data["pending"] runs under this lock.
+_deploy_lock = asyncio.Lock()
+
+
+_HTML_COMMENT_RE = re.compile(r"<!--.*?-->", re.S)
+_BLANK_LINES_RE = re.compile(r"\n\s*\n+")
+_SPACES_RE = re.compile(r"[ \t]+")
+
+
+def squash(text, strip_comments=False):
+    """Collapse indentation and blank lines (model-facing copy only)."""
+    if strip_comments:
+        text = _HTML_COMMENT_RE.sub("", text)
+    return _SPACES_RE.sub(" ", _BLANK_LINES_RE.sub("\n", text))
+
 
+def build_site_context(files, keep_raw=None):
+    """Format current site files as context for Claude.
 
-def build_site_context(files):
-    """Format current site files as context for Claude."""
+    Every file except ``keep_raw`` (the file being edited, which Claude must
+    reproduce verbatim) is squashed to save input tokens.
+    """
     if not files:
         return "No existing site files found."
     context_parts = []
     for path, content in files.items():
+        if path != keep_raw:
+            content = squash(content, strip_comments=path.endswith(".html"))
         # Truncate very large files to keep within token limits
         if len(content) > 15000:
             content = content[:15000] + "\n<!-- ... truncated ... -->"
@@ -129,33 +326,106 @@ RULES:
 IMPORTANT: Think of yourself as editing an existing codebase, not generating from scratch."""
 
 
-async def generate_with_context(prompt, target_file="index.html", site_files=None):
-    """Generate HTML with full site context."""
-    if site_files is None:
-        site_files = read_site_files()
-
-    site_context = build_site_context(site_files)
-
-    user_message = f"""Here are the CURRENT site files:
-
-{site_context}
-
----
+_SITE_CONTEXT_TEMPLATE = "Here are the CURRENT site files:\n\n{site_context}"
 
-TARGET FILE TO MODIFY: {target_file}
+_USER_TEMPLATE = """TARGET FILE TO MODIFY: {target_file}
 
 USER REQUEST: {prompt}
 
 Output the complete updated {target_file} file. Only change what was requested. Preserve everything else."""
 
-    response = claude.messages.create(
-        model="claude-sonnet-4-20250514",
-        max_tokens=8192,
-        system=SYSTEM_PROMPT,
+# Last system payload built, reused while the site files and target are unchanged
+_system_cache = {"target": None, "files": None, "blocks": None}
+
+
+def build_system_blocks(site_files, target_file):
+    """System prompt plus the site snapshot, marked for prompt caching.
+
+    The snapshot block is a cache breakpoint, so follow-up edits within the
+    cache window reuse it instead of paying for it again.
+    """
+    if _system_cache["target"] == target_file and _system_cache["files"] == site_files:
+        return _system_cache["blocks"]
+    site_context = build_site_context(site_files, keep_raw=target_file)
+    blocks = [
+        {"type": "text", "text": SYSTEM_PROMPT},
+        {
+            "type": "text",
+            "text": _SITE_CONTEXT_TEMPLATE.format(site_context=site_context),
+            "cache_control": {"type": "ephemeral"},
+        },
+    ]
+    _system_cache.update(target=target_file, files=dict(site_files), blocks=blocks)
+    return blocks
+
+
+PROGRESS_INTERVAL = 1.0  # seconds between streamed progress updates
+
+DEFAULT_MODEL = "claude-sonnet-4-20250514"
+DEFAULT_MAX_TOKENS = 8192
+FAST_MODEL = "claude-haiku-4-5-20251001"
+FAST_MAX_TOKENS = 2048
+
+
+def pick_model(prompt, target_file, site_files, fast=False):
+    """Choose (model, max_tokens): Haiku for short prompts on small files.
+
+    ``fast`` forces Haiku but keeps the full token budget, since the target
+    file may be large.
+    """
+    if fast:
+        return FAST_MODEL, DEFAULT_MAX_TOKENS
+    content = site_files.get(target_file)
+    if content is not None and len(prompt) < 80 and len(content) < 4000:
+        return FAST_MODEL, max(512, min(FAST_MAX_TOKENS, 2 * len(content) // 3))
+    return DEFAULT_MODEL, DEFAULT_MAX_TOKENS
+
+
+async def _stream_completion(model, max_tokens, system, user_message, on_progress=None):
+    """Stream one Claude completion; return (text, stop_reason)."""
+    chunks = []
+    received = 0
+    last_progress = time.monotonic()
+    async with claude.messages.stream(
+        model=model,
+        max_tokens=max_tokens,
+        system=system,
         messages=[{"role": "user", "content": user_message}]
-    )
+    ) as stream:
+        async for text in stream.text_stream:
+            chunks.append(text)
+            received += len(text)
+            if on_progress and time.monotonic() - last_progress >= PROGRESS_INTERVAL:
+                last_progress = time.monotonic()
+                await on_progress(received)
+        final = await stream.get_final_message()
+    return "".join(chunks), final.stop_reason
+
+
+async def generate_with_context(prompt, target_file="index.html", site_files=None, on_progress=None, fast=False):
+    """Generate HTML with full site context.
+
+    The response is streamed; ``on_progress(chars_so_far)`` is awaited at
+    most once per PROGRESS_INTERVAL while output arrives.
+    """
+    if site_files is None:
+        site_files = await asyncio.to_thread(read_site_files)
+
+    system = build_system_blocks(site_files, target_file)
+    model, max_tokens = pick_model(prompt, target_file, site_files, fast)
+    user_message = _USER_TEMPLATE.format(target_file=target_file, prompt=prompt)
+
+    text, stop_reason = await _stream_completion(model, max_tokens, system, user_message, on_progress)
+    if stop_reason == "max_tokens" and max_tokens < DEFAULT_MAX_TOKENS:
+        # The small-edit tier ran out of room; redo it with the full budget
+        logger.info(f"{model} hit max_tokens={max_tokens} on {target_file}, retrying with {DEFAULT_MODEL}")
+        text, stop_reason = await _stream_completion(
+            DEFAULT_MODEL, DEFAULT_MAX_TOKENS, system, user_message, on_progress
+        )
+    if stop_reason == "max_tokens":
+        raise RuntimeError(f"Output for {target_file} hit the token limit and was cut off. Nothing staged.")
 
-    html = response.content[0].text.strip()
+    html = text.strip()
     # Clean markdown fences if Claude adds them despite instructions
     if html.startswith("```"):
         lines = html.split("\n", 1)
@@ -173,6 +443,7 @@ async def cmd_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 *Commands:*
 /edit `<prompt>` — Edit index.html (reads current site first)
+/fast `<prompt>` — Same as /edit, using the faster Haiku model
 /editfile `<filename>` `<prompt>` — Edit a specific file
 /newfile `<filename>` `<prompt>` — Create a new file
 /status — Show current site files & recent deploys
@@ -201,8 +472,7 @@ async def cmd_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def cmd_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show current site files and recent deployments."""
     # List production files
-    prod_files = read_site_files(PROD_DIR)
-    dev_files = read_site_files(DEV_DIR)
+    prod_files, dev_files = await snapshot_site_files()
 
     msg = "📁 *Production files (public_html):*\n"
     for f in sorted(prod_files.keys()):
@@ -237,6 +507,15 @@ async def cmd_edit(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await _generate_and_stage(update, context, prompt, "index.html")
 
 
+async def cmd_fast(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Edit index.html with the fast model."""
+    prompt = update.message.text.replace("/fast", "", 1).strip()
+    if not prompt:
+        await update.message.reply_text("Usage: `/fast <what to change>`", parse_mode="Markdown")
+        return
+    await _generate_and_stage(update, context, prompt, "index.html", fast=True)
+
+
 async def cmd_editfile(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Edit a specific file."""
     parts = update.message.text.replace("/editfile", "", 1).strip().split(" ", 1)
@@ -257,14 +536,55 @@ async def cmd_newfile(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await _generate_and_stage(update, context, prompt, filename, is_new=True)
 
 
-async def _generate_and_stage(update, context, prompt, target_file, is_new=False):
-    """Core: generate content with Claude using site context, stage to /dev."""
-    await update.message.reply_text(f"🔄 Reading current site files...")
+def _write_staged_file(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+async def _generate_and_stage(update, context, prompt, target_file, is_new=False, fast=False):
+    """Core: generate content with Claude using site context, stage to /dev.
 
-    site_files = read_site_files()
+    Only one edit per user runs at a time: with concurrent updates a second
+    message would otherwise race the first and silently replace its pending
+    deploy (or orphan its staged file if the targets differ).
+    """
+    # Check-and-set with no await in between, so it is atomic on the event
+    # loop; _deploy_lock isn't needed (and would wait behind a git push).
+    if context.user_data.get("generating"):
+        await update.message.reply_text(
+            "⏳ Still working on your previous edit. Wait for it to finish, then try again."
+        )
+        return
+    context.user_data["generating"] = True
+    try:
+        await _run_generate_and_stage(update, context, prompt, target_file, is_new, fast)
+    finally:
+        context.user_data["generating"] = False
+
+
+async def _run_generate_and_stage(update, context, prompt, target_file, is_new, fast):
+    # No separate "Reading..." ack: the read is served from the mtime cache in
+    # the common case, so one status message (edited as Claude streams) is enough.
+    site_files = await asyncio.to_thread(read_site_files)
     file_count = len(site_files)
 
     if not is_new and target_file not in site_files:
+        prod_path = os.path.join(PROD_DIR, target_file)
+        if os.path.isfile(prod_path):
+            # Present but skipped by read_site_files: don't suggest /newfile,
+            # which would replace the existing file from scratch.
+            if ".min." in os.path.basename(target_file):
+                reason = "is minified"
+            elif os.path.getsize(prod_path) > MAX_READ:
+                reason = f"is larger than {MAX_READ:,} bytes"
+            else:
+                reason = "could not be read as a site file"
+            await update.message.reply_text(
+                f"⚠️ `{target_file}` exists in production but {reason}, so it can't be edited by the bot.",
+                parse_mode="Markdown"
+            )
+            return
         # Check if file exists but wasn't caught (e.g., different extension)
         available = ", ".join(sorted(site_files.keys()))
         await update.message.reply_text(
@@ -275,34 +595,43 @@ async def _generate_and_stage(update, context, prompt, target_file, is_new=False
         )
         return
 
-    await update.message.reply_text(
+    status_msg = await update.message.reply_text(
         f"📖 Read {file_count} file(s). Generating changes with Claude..."
     )
 
+    async def show_progress(chars):
+        try:
+            await status_msg.edit_text(f"✍️ Generating changes with Claude... {chars:,} chars so far")
+        except Exception as e:
+            logger.debug(f"Progress update failed: {e}")
+
     try:
-        generated = await generate_with_context(prompt, target_file, site_files)
+        generated = await generate_with_context(prompt, target_file, site_files, on_progress=show_progress, fast=fast)
+
+        # Encode once: the same bytes are hashed and written to disk
+        data = generated.encode("utf-8")
 
         # Check for duplicate deployment
-        h = content_hash(generated)
+        h = content_hash(data)
         if was_already_deployed(target_file, h):
             await update.message.reply_text(
                 "⚠️ This exact content was already deployed. No changes needed."
             )
             return
 
-        # Stage to /dev
         dev_filepath = os.path.join(DEV_DIR, target_file)
-        os.makedirs(os.path.dirname(dev_filepath), exist_ok=True)
-        with open(dev_filepath, "w", encoding="utf-8") as f:
-            f.write(generated)
-
-        # Store pending info for confirmation
-        context.user_data["pending"] = {
-            "file": target_file,
-            "hash": h,
-            "prompt": prompt,
-            "dev_path": dev_filepath,
-        }
+
+        # Stage to /dev (a local write) before telling the user anything
+        async with _deploy_lock:
+            await asyncio.to_thread(_write_staged_file, dev_filepath, data)
+
+            # Store pending info for confirmation
+            context.user_data["pending"] = {
+                "file": target_file,
+                "hash": h,
+                "prompt": prompt,
+                "dev_path": dev_filepath,
+            }
 
         # Show preview
         preview = generated[:800]
@@ -316,7 +645,17 @@ async def _generate_and_stage(update, context, prompt, target_file, is_new=False
             f"→ Reply *yes* to deploy or *no* to cancel\n"
             f"→ Or use `/preview` to see more"
         )
-        await update.message.reply_text(msg, parse_mode="Markdown")
+        try:
+            await update.message.reply_text(msg, parse_mode="Markdown")
+        except Exception as e:
+            # The file is staged and pending either way; say so without the preview
+            logger.warning(f"Staged preview failed: {e}")
+            await update.message.reply_text(
+                f"✅ Staged to /dev/{target_file} ({len(generated):,} chars), "
+                f"but the preview could not be shown.\n"
+                f"→ Reply yes to deploy or no to cancel\n"
+                f"→ Or use /preview to see the file"
+            )
 
     except Exception as e:
         logger.error(f"Generation error: {e}")
@@ -328,18 +667,22 @@ async def cmd_deploy(update: Update, context: ContextTypes.DEFAULT_TYPE):
     pending = context.user_data.get("pending")
     if not pending:
         # Check if there are any files in dev anyway
-        dev_files = read_site_files(DEV_DIR)
+        dev_files = await asyncio.to_thread(read_site_files, DEV_DIR)
         if not dev_files:
             await update.message.reply_text("Nothing staged in /dev to deploy.")
             return
 
+    # Telegram replies stay outside the lock so a slow send can't hold up
+    # other users' deploys; the lock only covers git, the log and pending.
     await update.message.reply_text("🚀 Pushing to GitHub...")
-    commit_msg = f"Bot deploy: {pending['prompt'][:60]}" if pending else "Bot deploy: manual push"
-    result = git_push(REPO_PATH, commit_msg)
+    async with _deploy_lock:
+        pending = context.user_data.get("pending")  # may have changed while replying
+        commit_msg = f"Bot deploy: {pending['prompt'][:60]}" if pending else "Bot deploy: manual push"
+        result = await asyncio.to_thread(git_push, REPO_PATH, commit_msg)
 
-    if pending and "✅" in result:
-        log_deployment(pending["file"], pending["hash"], pending["prompt"])
-        context.user_data["pending"] = None
+        if pending and "✅" in result:
+            log_deployment(pending["file"], pending["hash"], pending["prompt"])
+            context.user_data["pending"] = None
 
     await update.message.reply_text(result)
 
@@ -365,14 +708,16 @@ async def cmd_preview(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def cmd_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Cancel pending changes."""
-    pending = context.user_data.get("pending")
+    async with _deploy_lock:
+        pending = context.user_data.get("pending")
+        if pending:
+            # Remove staged file
+            try:
+                os.remove(pending["dev_path"])
+            except OSError:
+                pass
+            context.user_data["pending"] = None
     if pending:
-        # Remove staged file
-        try:
-            os.remove(pending["dev_path"])
-        except OSError:
-            pass
-        context.user_data["pending"] = None
         await update.message.reply_text("🗑️ Cancelled. Staged file removed.")
     else:
         await update.message.reply_text("Nothing to cancel.")
@@ -380,8 +725,7 @@ async def cmd_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def cmd_diff(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show differences between /dev and production."""
-    prod_files = read_site_files(PROD_DIR)
-    dev_files = read_site_files(DEV_DIR)
+    prod_files, dev_files = await snapshot_site_files()
 
     if not dev_files:
         await update.message.reply_text("No files staged in /dev.")
@@ -445,13 +789,17 @@ def main():
 
     # Ensure /dev directory exists
     os.makedirs(DEV_DIR, exist_ok=True)
+    _migrate_legacy_deploy_log()
 
-    app = Application.builder().token(TELEGRAM_TOKEN).build()
+    # Concurrent updates let other chats be served while one waits on Claude
+    # or git; shared deploy state is serialised by _deploy_lock.
+    app = Application.builder().token(TELEGRAM_TOKEN).concurrent_updates(True).build()
 
     # Commands
     app.add_handler(CommandHandler("start", cmd_start))
     app.add_handler(CommandHandler("help", cmd_help))
     app.add_handler(CommandHandler("edit", cmd_edit))
+    app.add_handler(CommandHandler("fast", cmd_fast))
     app.add_handler(CommandHandler("editfile", cmd_editfile))
     app.add_handler(CommandHandler("newfile", cmd_newfile))
     app.add_handler(CommandHandler("status", cmd_status))
@@ -461,7 +809,7 @@ def main():
     app.add_handler(CommandHandler("diff", cmd_diff))
 
     # Yes/No confirmation (must come before general message handler)
-    app.add_handler(MessageHandler(filters.Regex(r"(?i)^(yes|y|no|n)$"), handle_confirm))
+    app.add_handler(MessageHandler(filters.Regex(CONFIRM_RE), handle_confirm))
 
     # Default: plain text → edit index.html
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
@@ -1,5 +1,5 @@
 #!/usr/bin/env python3
-import os, subprocess, shutil, logging
+import os, subprocess, shutil, logging, filecmp
 from telegram import Update
 from telegram.ext import Application, MessageHandler, CommandHandler, filters, ContextTypes
 import anthropic
@@ -17,14 +17,38 @@ PROD_DIR = os.path.join(REPO_PATH, "public_html")
 
 def git_push(repo_path, message):
     try:
-        os.chdir(repo_path)
-        subprocess.run(["git", "add", "."], check=True, capture_output=True)
-        subprocess.run(["git", "commit", "-m", message], check=True, capture_output=True, text=True)
-        subprocess.run(["git", "push", "origin", "main"], check=True, capture_output=True)
+        subprocess.run(["git", "add", "."], cwd=repo_path, check=True, capture_output=True)
+        subprocess.run(["git", "commit", "-m", message], cwd=repo_path, check=True, capture_output=True, text=True)
+        subprocess.run(["git", "push", "origin", "main"], cwd=repo_path, check=True, capture_output=True)
         return "Pushed to GitHub"
     except subprocess.CalledProcessError as e:
         return "Git error: " + str(e)
 
+def compare_dirs(a, b):
+    """In-process version of `diff --brief a b` (top level only).
+
+    Reports the same "Only in", "Files ... differ" and file/directory
+    mismatch lines, but omits diff's "Common subdirectories" lines.
+    filecmp rejects on size before reading any content.
+    """
+    a_names, b_names = set(os.listdir(a)), set(os.listdir(b))
+    lines = []
+    for name in sorted(a_names | b_names):
+        if name not in b_names:
+            lines.append("Only in " + a + ": " + name)
+        elif name not in a_names:
+            lines.append("Only in " + b + ": " + name)
+        else:
+            pa, pb = os.path.join(a, name), os.path.join(b, name)
+            a_dir, b_dir = os.path.isdir(pa), os.path.isdir(pb)
+            if a_dir != b_dir:
+                a_kind = "directory" if a_dir else "regular file"
+                b_kind = "directory" if b_dir else "regular file"
+                lines.append("File " + pa + " is a " + a_kind + " while file " + pb + " is a " + b_kind)
+            elif not a_dir and not filecmp.cmp(pa, pb, shallow=False):
+                lines.append("Files " + pa + " and " + pb + " differ")
+    return "\n".join(lines)
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(
         "IGNYTE Deploy Bot\n\n"
@@ -36,8 +60,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
-        os.chdir(REPO_PATH)
-        result = subprocess.run(["git", "log", "--oneline", "-5"], capture_output=True, text=True)
+        result = subprocess.run(["git", "log", "--oneline", "-5"], cwd=REPO_PATH, capture_output=True, text=True)
         await update.message.reply_text("Last 5 commits:\n\n" + result.stdout)
     except Exception as e:
         await update.message.reply_text("Error: " + str(e))
@@ -52,9 +75,9 @@ async def diff(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if not os.path.exists(prod_index):
             await update.message.reply_text("No prod index.html yet. Dev is ready to promote.")
             return
-        result = subprocess.run(["diff", "--brief", DEV_DIR, PROD_DIR], capture_output=True, text=True)
-        if result.stdout:
-            await update.message.reply_text("Differences:\n" + result.stdout)
+        result = compare_dirs(DEV_DIR, PROD_DIR)
+        if result:
+            await update.message.reply_text("Differences:\n" + result)
         else:
             await update.message.reply_text("Dev and prod are identical.")
     except Exception as e: